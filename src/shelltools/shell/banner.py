@@ -1,7 +1,9 @@
-import os
 from typing import Callable
 
-import terminology as tmg
+from ..utility.lazy_module import LazyModule
+from ..utility.terminal import get_columns
+
+tmg = LazyModule("terminology")
 
 
 class ProgressBar:
@@ -25,6 +27,7 @@ class ProgressBar:
         self.__modifier = modifier
         self.__bg_modifier_when_full = bg_modifier_when_full
         self.__progress = 0.0
+        self.__version = 0
 
     def __str__(self) -> str:
         """
@@ -35,15 +38,12 @@ class ProgressBar:
         if self.__progress > 1:
             overflow_text = "OVERFLOW >>"
             return self.__modifier(prefix) + self.__bg_modifier_when_full(
-                (os.get_terminal_size().columns - len(prefix + overflow_text)) * " "
-                + overflow_text
+                (get_columns() - len(prefix + overflow_text)) * " " + overflow_text
             )
         if self.__progress < 0:
             return self.__modifier(prefix + " << UNDERFLOW")
 
-        blocks_nb = int(
-            8 * (os.get_terminal_size().columns - len(prefix)) * self.__progress
-        )
+        blocks_nb = int(8 * (get_columns() - len(prefix)) * self.__progress)
         remainder = blocks_nb % 8
         last_chr = chr(ord("█") + 7 - remainder)
         return self.__modifier(prefix + int(blocks_nb / 8) * "█" + last_chr)
@@ -58,6 +58,16 @@ class ProgressBar:
     @progress.setter
     def progress(self, p: float) -> None:
         self.__progress = p
+        self.__version += 1
+
+    @property
+    def version(self) -> int:
+        """
+        Number of times the progress has been changed
+
+        It is used by the shell to know when the bar has to be rendered again.
+        """
+        return self.__version
 
 
 class TwoWayBar:
@@ -81,13 +91,14 @@ class TwoWayBar:
         self.__modifier = modifier
         self.__bg_modifier = bg_modifier
         self.__progress = 0.0
+        self.__version = 0
 
     def __str__(self) -> str:
         """
         Get the string representation of the bar
         """
         prefix = f"| {self.__text} |"
-        screen_width = os.get_terminal_size().columns
+        screen_width = get_columns()
         origin = int((screen_width - len(prefix)) / 2)
 
         if self.__progress > 1:
@@ -129,6 +140,16 @@ class TwoWayBar:
     @progress.setter
     def progress(self, p: float) -> None:
         self.__progress = p
+        self.__version += 1
+
+    @property
+    def version(self) -> int:
+        """
+        Number of times the progress has been changed
+
+        It is used by the shell to know when the bar has to be rendered again.
+        """
+        return self.__version
 
 
 class BarSpinner:
@@ -158,6 +179,4 @@ class BarSpinner:
             + self.PATTERN[(self.__progress + 2) % len(self.PATTERN)]
         )
 
-        return self.__modifier(
-            line + (os.get_terminal_size().columns - len(line)) * " "
-        )
+        return self.__modifier(line + (get_columns() - len(line)) * " ")
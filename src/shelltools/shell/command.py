@@ -1,16 +1,30 @@
 import asyncio as aio
 import os
-import threading
-from argparse import ArgumentParser, Namespace
+from argparse import SUPPRESS, Action, ArgumentParser, ArgumentTypeError, Namespace
 from textwrap import dedent
-from typing import Any, Callable, Coroutine, Dict, NoReturn, Optional, Union
-
-import terminology as tmg
-
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    List,
+    NoReturn,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from ..utility.lazy_module import LazyModule
 from .keyboard_listener import KeyboardListener
 from .shell import Shell, ShellType
 
+tmg = LazyModule("terminology")
+
 KNOWN_COMPATIBLE_TERMINALS = ["xterm"]
+PARSE_CACHE_SIZE = 128
+
+_CACHEABLE_TYPES = (type(None), bool, int, float, complex, str, bytes)
+_FAST_POSITIONAL_KEYWORDS = {"type", "help", "metavar"}
 
 
 def command(capture_keyboard: Optional[str] = None) -> Callable:
@@ -26,8 +40,18 @@ def command(capture_keyboard: Optional[str] = None) -> Callable:
         nonlocal capture_keyboard
 
         wrapper = _ensure_wrapper(f)
+        wrapper.parser.finalize()
 
-        return lambda obj, line: startup(obj, line, wrapper)
+        if capture_keyboard is not None:
+            return lambda obj, line: startup(obj, line, wrapper)
+
+        def run(obj, line):
+            if not obj.is_running:
+                return True
+
+            wrapper.call_command(obj, line, {}, cleanup, False)
+
+        return run
 
     def startup(obj, line, wrapper):
         nonlocal capture_keyboard
@@ -86,16 +110,26 @@ class _Wrapper:
         Hold a callable which will received the CLI arguments
         """
         self.__f = f
+        self.__is_async = aio.iscoroutinefunction(f)
 
-        doc = tmg.in_bold(dedent(f.__doc__)) if f.__doc__ else None
+        doc = dedent(f.__doc__) if f.__doc__ else None
         self.parser = _Parser(prog=f.__name__, description=doc)
+        self.__parse_cache: Dict[str, Dict[str, Any]] = {}
+        self.__parse_cache_version = self.parser.version
 
     @property
     def is_async(self) -> bool:
         """
         Tell whether the stored callable is an async function
         """
-        return aio.iscoroutinefunction(self.__f)
+        return self.__is_async
+
+    @property
+    def has_arguments(self) -> bool:
+        """
+        Tell whether an argument has been added to the parser
+        """
+        return self.parser.version > 0
 
     def call_command(
         self,
@@ -109,7 +143,7 @@ class _Wrapper:
         Forward the accumulated CLI argument to the held async function
 
         The async function will also be given the ``extra_parameters`` keyword parameters.
-        If ``is_blocking`` is ``True``, the thread reading the standard input will block until the command is done.
+        If ``is_blocking`` is ``True``, no other command will be read until the command is done.
 
         When the command is done, ``cleanup`` will be called.
         """
@@ -117,22 +151,16 @@ class _Wrapper:
 
         try:
             if self.is_async:
-                coro = self.__f(
-                    shell, **vars(self.parser.parse(shell, line)), **extra_parameters
-                )
+                coro = self.__f(shell, **self.__parse(shell, line), **extra_parameters)
                 if is_blocking:
-                    done_event = threading.Event()
-                    shell.create_task(
-                        _run_then_notify(coro, done_event), cleanup_callback
-                    )
-                    done_event.wait()
+                    shell.create_blocking_task(coro, cleanup_callback)
                 else:
                     shell.create_task(coro, cleanup_callback)
             else:
                 shell.call_soon(
                     self.__f,
                     shell,
-                    **vars(self.parser.parse(shell, line)),
+                    **self.__parse(shell, line),
                     **extra_parameters,
                     cleanup_callback=cleanup_callback,
                 )
@@ -144,12 +172,185 @@ class _Wrapper:
 
         return True
 
+    def __parse(self, shell: Shell, line: str) -> Dict[str, Any]:
+        """
+        Parse the CLI arguments, reusing the result of a previous parsing of the same line if possible
+
+        Only results made of immutable scalar values are cached, so a command cannot alter the arguments given to a later call. The cache is emptied whenever an argument is added to the parser.
+
+        Parsing is skipped altogether when the command takes no argument and none is given.
+        """
+        if not self.has_arguments and not line.strip():
+            return {}
+
+        if self.__parse_cache_version != self.parser.version:
+            self.__parse_cache.clear()
+            self.__parse_cache_version = self.parser.version
+
+        kwargs = self.__parse_cache.get(line)
+        if kwargs is not None:
+            return kwargs
+
+        kwargs = self.parser.parse_fast(line)
+        if kwargs is None:
+            kwargs = vars(self.parser.parse(shell, line))
+
+        if all(type(value) in _CACHEABLE_TYPES for value in kwargs.values()):
+            if len(self.__parse_cache) >= PARSE_CACHE_SIZE:
+                del self.__parse_cache[next(iter(self.__parse_cache))]
+            self.__parse_cache[line] = kwargs
+
+        return kwargs
+
+
+class _Parser:
+    """
+    Hold the argument specifications of a command and parse its command lines
+
+    The underlying ``ArgumentParser`` is only built when it is actually needed, that is when a line cannot be handled by the fast parser or when the specifications are too complex for it. Until then, the specifications are merely recorded.
+    """
+
+    __slots__ = (
+        "version",
+        "prefix_chars",
+        "__parser_args",
+        "__specs",
+        "__fast",
+        "__parser",
+        "__actions",
+    )
+
+    def __init__(self, *args, **kwargs):
+        """
+        Store the parameters of the underlying parser
+        """
+        self.version = 0
+        self.prefix_chars = kwargs.get("prefix_chars", "-")
+        self.__parser_args = (args, kwargs)
+        self.__specs: List[Tuple[Tuple[Any, ...], Dict[str, Any]]] = []
+        self.__fast: Optional[
+            Tuple[Tuple[Tuple[str, Callable[[str], Any]], ...], Dict[str, Any]]
+        ] = None
+        self.__parser: Optional[_ArgumentParser] = None
+        self.__actions: List[Tuple[Action, Dict[str, Any]]] = []
+
+    def add_argument(self, *args, **kwargs) -> None:
+        """
+        Add an argument specification and bump the parser version
+
+        The version allows the users of the parser to know when the results they cached are outdated. The specification is forwarded to ``ArgumentParser.add_argument`` once the underlying parser is built.
+        """
+        self.version += 1
+        self.__fast = None
+        self.__specs.append((args, kwargs))
+
+        if self.__parser is not None:
+            action = self.__parser.add_argument(*args, **kwargs)
+            self.__actions.append((action, kwargs))
 
-class _Parser(ArgumentParser):
+    def finalize(self) -> None:
+        """
+        Build a fast parser from the argument specifications if they are simple enough
+
+        The fast parser only handles positional arguments given without ``nargs``, ``action``, ``choices`` or ``default``. Optional arguments are given their default value, so any line containing an option is left to ``parse``. The underlying parser is built right away otherwise, so an invalid specification raises when the command is defined, and optional arguments get their default values computed by ``argparse``.
+        """
+        if all(self.__is_simple_positional(*spec) for spec in self.__specs):
+            simple_positionals = tuple(
+                (args[0], kwargs.get("type") or str) for args, kwargs in self.__specs
+            )
+            self.__fast = (simple_positionals, {})
+            return
+
+        self.__get_parser()
+        positionals = []
+        defaults = {}
+
+        for action, kwargs in self.__actions:
+            if action.option_strings:
+                if action.required or (
+                    isinstance(action.default, str) and action.type is not None
+                ):
+                    return
+                if action.dest is not SUPPRESS and action.default is not SUPPRESS:
+                    defaults[action.dest] = action.default
+            elif kwargs.keys() <= _FAST_POSITIONAL_KEYWORDS:
+                positionals.append((action.dest, action.type or str))
+            else:
+                return
+
+        self.__fast = (tuple(positionals), defaults)
+
+    def parse_fast(self, line: str) -> Optional[Dict[str, Any]]:
+        """
+        Parse the argument from a command line without going through ``ArgumentParser.parse_args``
+
+        ``None`` is returned if the fast parser has not been built or cannot handle the line (an option is given, the number of arguments is wrong or a conversion failed). In that case, ``parse`` should be used instead.
+        """
+        if self.__fast is None:
+            return None
+
+        positionals, defaults = self.__fast
+        tokens = line.split()
+        if len(tokens) != len(positionals):
+            return None
+
+        kwargs = dict(defaults)
+        try:
+            for (dest, convert), token in zip(positionals, tokens):
+                if token[0] in self.prefix_chars:
+                    return None
+                kwargs[dest] = convert(token)
+        except (ArgumentTypeError, TypeError, ValueError):
+            return None
+
+        return kwargs
+
+    def parse(self, shell: Shell, line: str) -> Namespace:
+        """
+        Parse the argument from a command line with the underlying parser
+
+        Instead of exiting the program, this method will raise a ``ShellError()`` if the parsing fails.
+        """
+        return self.__get_parser().parse(shell, line)
+
+    def __get_parser(self) -> "_ArgumentParser":
+        """
+        Get the underlying parser, building it first if needed
+        """
+        if self.__parser is None:
+            parser_args, parser_kwargs = self.__parser_args
+            self.__parser = _ArgumentParser(*parser_args, **parser_kwargs)
+            self.__actions = [
+                (self.__parser.add_argument(*args, **kwargs), kwargs)
+                for args, kwargs in self.__specs
+            ]
+
+        return self.__parser
+
+    def __is_simple_positional(
+        self, args: Tuple[Any, ...], kwargs: Dict[str, Any]
+    ) -> bool:
+        """
+        Tell whether an argument specification can be handled by the fast parser without the help of ``argparse``
+
+        The specification must also be one that ``ArgumentParser.add_argument`` accepts, so invalid ones are still rejected by ``argparse`` when the command is defined.
+        """
+        return (
+            len(args) == 1
+            and isinstance(args[0], str)
+            and args[0][:1] not in self.prefix_chars
+            and kwargs.keys() <= _FAST_POSITIONAL_KEYWORDS
+            and callable(kwargs.get("type") or str)
+            and isinstance(kwargs.get("metavar") or "", str)
+        )
+
+
+class _ArgumentParser(ArgumentParser):
     def __init__(self, *args, **kwargs):
         """
         Initialize the underlying parser
         """
+        self.__is_description_formatted = False
         super().__init__(
             *args,
             **kwargs,
@@ -173,7 +374,13 @@ class _Parser(ArgumentParser):
     def print_help(self, _=None) -> None:
         """
         Print the help string to the output stream of the shell
+
+        The description is put in bold the first time the help is printed, so ``terminology`` is not needed before then.
         """
+        if not self.__is_description_formatted and self.description is not None:
+            self.description = tmg.in_bold(self.description)
+        self.__is_description_formatted = True
+
         self.__shell.log_help(self.format_help())
 
     def error(self, msg: str) -> NoReturn:
@@ -193,16 +400,6 @@ class _Parser(ArgumentParser):
         self.__shell.log(message)
 
 
-async def _run_then_notify(coro: Coroutine, done_event: threading.Event):
-    """
-    Await ``coro`` then notify the caller that ``coro`` is done through ``done_event``
-
-    This function is used to wait the completion of a coroutine from another thread.
-    """
-    await coro
-    done_event.set()
-
-
 def _ensure_wrapper(f: Union[Callable[..., Coroutine], _Wrapper]) -> _Wrapper:
     """
     Wrap an async function if needed
@@ -1,19 +1,41 @@
 import asyncio as aio
 import cmd
+import os
 import threading
+from collections import deque
 from contextlib import asynccontextmanager
 from functools import partial
 from sys import stdin, stdout
-from typing import Callable, Coroutine, List, Optional, TextIO, TypeVar
-
-import terminology as tmg
-
+from typing import (
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+from ..utility.lazy_module import LazyModule
 from ..utility.synchronized_ostream import SynchronizedOStream
+from ..utility.terminal import start_tracking_resize, stop_tracking_resize
+
+readline = LazyModule("readline")
+rle = LazyModule("..utility.readline_extension", __package__)
+tmg = LazyModule("terminology")
 
 DEFAULT_PROMPT = "[shell] > "
 
 
 class Shell(cmd.Cmd):
+    _do_names: FrozenSet[str]
+    _help_names: FrozenSet[str]
+    _complete_names: FrozenSet[str]
+
     def __init__(
         self,
         prompt: str = DEFAULT_PROMPT,
@@ -23,33 +45,136 @@ class Shell(cmd.Cmd):
         """
         Initialize the base class with IO streams
 
-        ``use_rawinput`` will be set to ``True`` if and only if the provided streams are connected to a terminal.
+        ``use_rawinput`` will be set to ``True`` if and only if the provided streams are connected to a terminal. It is stored along with ``prompt`` as an instance attribute which shadows the class attribute of the same name.
         """
 
         self.__use_rawinput = istream.isatty() and ostream.isatty()
         self.__istream = istream
         self.__ostream = SynchronizedOStream(
-            ostream, use_rawinput=self.__use_rawinput, modifier=tmg.in_yellow
+            ostream,
+            use_rawinput=self.__use_rawinput,
+            modifier=lambda x: tmg.in_yellow(x),
         )
-        self.__prompt = prompt
         self.__running_tasks: List[aio.Task] = []
+        self.__pending_callbacks: Deque[Callable[[], None]] = deque()
+        self.__pending_callbacks_lock = threading.Lock()
         self.__continue = False
+        self.__loop_thread_id: Optional[int] = None
+        self.__reading_done: Optional[aio.Future] = None
+        self.__is_reading = False
+        self.__blocking_tasks_nb = 0
 
         super().__init__(stdin=istream, stdout=self.__ostream)
 
-    @property
-    def prompt(self):
+        self.use_rawinput = self.__use_rawinput
+        self.prompt = "\r" + prompt if self.__use_rawinput else ""
+
+        self.__commands: Dict[str, Callable[[str], Optional[bool]]] = {
+            name[3:]: getattr(self, name) for name in self._do_names
+        }
+        self.__has_precmd = type(self).precmd is not cmd.Cmd.precmd
+        self.__has_postcmd = type(self).postcmd is not cmd.Cmd.postcmd
+
+    def __init_subclass__(cls, **kwargs):
         """
-        Shadows the ``prompt`` class attribute to make it instance-bound.
+        Index the command-related methods of the new shell class
+
+        The methods are looked up once per class instead of once per instance or per help request.
         """
-        return "\r" + self.__prompt if self.__use_rawinput else ""
+        super().__init_subclass__(**kwargs)
+        _index_names(cls)
 
-    @property
-    def use_rawinput(self):
+    def get_names(self) -> List[str]:
+        """
+        Get the names of the command-related methods
+
+        It overrides the base class method of the same name, which is used to look up commands, help topics and completers. Only the names starting with ``do_``, ``help_`` or ``complete_`` are returned, as they were indexed when the class was created.
+        """
+        cls = type(self)
+        return list(cls._do_names | cls._help_names | cls._complete_names)
+
+    def cmdloop(self, intro: Optional[str] = None) -> None:
+        """
+        Repeatedly read and run commands until one of them asks to stop
+
+        It overrides the base class method of the same name. ``precmd`` and ``postcmd`` are only called if they are overridden, and the output stream is only written to and flushed if there is a prompt to show.
         """
-        Shadows the ``use_rawinput`` class attribute to make it instance-bound.
+        self.preloop()
+        old_completer = None
+        if self.use_rawinput and self.completekey:
+            try:
+                old_completer = readline.get_completer()
+                readline.set_completer(self.complete)
+                readline.parse_and_bind(self.completekey + ": complete")
+            except ImportError:
+                pass
+
+        try:
+            if intro is not None:
+                self.intro = intro
+            if self.intro:
+                self.stdout.write(str(self.intro) + "\n")
+
+            stop = False
+            while not stop:
+                if self.cmdqueue:
+                    line = self.cmdqueue.pop(0)
+                elif self.use_rawinput:
+                    try:
+                        line = input(self.prompt)
+                    except EOFError:
+                        line = "EOF"
+                else:
+                    if self.prompt:
+                        self.stdout.write(self.prompt)
+                        self.stdout.flush()
+                    line = self.stdin.readline()
+                    line = line.rstrip("\r\n") if line else "EOF"
+
+                stop = self.__run_line(line)
+
+            self.postloop()
+        finally:
+            if self.use_rawinput and self.completekey:
+                try:
+                    readline.set_completer(old_completer)
+                except ImportError:
+                    pass
+
+    def parseline(self, line: str) -> Tuple[Optional[str], Optional[str], str]:
+        """
+        Split a line into the command name and its arguments
+
+        It overrides the base class method of the same name. The command name is delimited by whitespace instead of being scanned character by character against ``identchars``. Lines starting with ``?`` or ``!`` are still handled by the base class.
         """
-        return self.__use_rawinput
+        line = line.strip()
+        if not line:
+            return None, None, line
+        if line[0] in "?!":
+            return super().parseline(line)
+
+        name, *arg = line.split(maxsplit=1)
+        return name, arg[0] if arg else "", line
+
+    def onecmd(self, line: str) -> bool:
+        """
+        Interpret a line as a command and dispatch it
+
+        It overrides the base class method of the same name. The command handler is looked up in a table built at initialization instead of being resolved with ``getattr`` for every line.
+        """
+        name, arg, line = self.parseline(line)
+        if not line:
+            return bool(self.emptyline())
+        if name is None or arg is None:
+            return bool(self.default(line))
+
+        self.lastcmd = line if line != "EOF" else ""
+
+        handler = self.__commands.get(name)
+        if handler is None:
+            return bool(self.default(line))
+
+        return bool(handler(arg))
 
     def default(self, line):
         """
@@ -75,19 +200,32 @@ class Shell(cmd.Cmd):
         """
         Start a shell session asynchronously
 
-        When the user decides to exit the shell, every running task will be cancelled, and the shell will wait for them to terminate.
+        When the user decides to exit the shell, every running task will be cancelled, and the shell will wait for them to terminate. Everything logged is written and the output stream writer is stopped before returning, even if an error is raised.
+
+        In a terminal, the width is cached until the terminal is resized for as long as the shell runs. On POSIX systems, the commands typed in a terminal are read by the loop itself. Otherwise, ``cmdloop`` is run in another thread.
         """
         self.__loop = aio.get_event_loop()
+        self.__loop_thread_id = threading.get_ident()
         self.__continue = True
-        await self.__to_thread(self.cmdloop)
+        is_resize_tracked = self.__use_rawinput and start_tracking_resize(self.__loop)
+
+        try:
+            if self.__use_rawinput and os.name == "posix":
+                await self.__read_commands()
+            else:
+                await self.__loop.run_in_executor(None, self.cmdloop)
 
-        self.log_status("Exiting the shell...", regenerate_prompt=False)
+            self.log_status("Exiting the shell...", regenerate_prompt=False)
 
-        for task in self.__running_tasks:
-            task.cancel()
+            for task in self.__running_tasks:
+                task.cancel()
 
-        while self.__running_tasks != []:
-            await aio.sleep(0)
+            while self.__running_tasks != []:
+                await aio.sleep(0)
+        finally:
+            if is_resize_tracked:
+                stop_tracking_resize()
+            self.__ostream.stop()
 
     @property
     def is_running(self) -> bool:
@@ -103,10 +241,27 @@ class Shell(cmd.Cmd):
         cleanup_callback: Callable[[], None] = lambda: None,
         **kwargs,
     ) -> None:
-        async def impl(f, *args, **kwargs):
-            f(*args, **kwargs)
+        """
+        Schedule a synchronous function to be called
+
+        This method is thread-safe. The function is called by the loop without being wrapped in a task, and this method returns once the call is over. Exceptions raised by the function are handled in the same way as those raised by a task.
 
-        self.create_task(impl(f, *args, **kwargs), cleanup_callback)
+        A cleanup callback can be provided, which will be invoked when the call is done.
+        """
+        if self.__is_in_loop_thread():
+            self.__call(partial(f, *args, **kwargs), cleanup_callback, None)
+            return
+
+        call_done_event = threading.Event()
+        self.__call_soon_threadsafe(
+            partial(
+                self.__call,
+                partial(f, *args, **kwargs),
+                cleanup_callback,
+                call_done_event,
+            )
+        )
+        call_done_event.wait()
 
     def create_task(
         self, coro: Coroutine, cleanup_callback: Callable[[], None] = lambda: None
@@ -120,17 +275,64 @@ class Shell(cmd.Cmd):
 
         This method make sure the provided coroutine is given the chance to run at least once before another command is processed. This way, the coroutine will not be cancelled by an EOF or any other command that terminates the shell without being given the chance to handle the cancellation.
         """
+        if self.__is_in_loop_thread():
+            self.__create_task(coro, cleanup_callback, None)
+            return
+
         task_running_event = threading.Event()
-        self.__loop.call_soon_threadsafe(
-            self.__create_task, coro, cleanup_callback, task_running_event
+        self.__call_soon_threadsafe(
+            partial(self.__create_task, coro, cleanup_callback, task_running_event)
         )
         task_running_event.wait()
 
+    def create_blocking_task(
+        self, coro: Coroutine, cleanup_callback: Callable[[], None] = lambda: None
+    ) -> None:
+        """
+        Schedule a coroutine to be carried out and stop reading commands until it is done
+
+        This method is thread-safe and behaves like ``create_task`` otherwise.
+        """
+        if self.__is_in_loop_thread():
+            reading_done = self.__reading_done
+            if reading_done is None or reading_done.done():
+                self.create_task(coro, cleanup_callback)
+                return
+
+            self.__blocking_tasks_nb += 1
+            self.__pause_reading()
+
+            def cleanup():
+                try:
+                    cleanup_callback()
+                finally:
+                    self.__blocking_tasks_nb -= 1
+                    self.__resume_reading()
+
+            try:
+                self.create_task(coro, cleanup)
+            except BaseException:
+                self.__blocking_tasks_nb -= 1
+                self.__resume_reading()
+                raise
+            return
+
+        task_done_event = threading.Event()
+
+        async def impl():
+            try:
+                await coro
+            finally:
+                task_done_event.set()
+
+        self.create_task(impl(), cleanup_callback)
+        task_done_event.wait()
+
     def log(self, *args, **kwargs) -> None:
         """
         Log a message of any choosen style
 
-        ``args`` and ``kwargs`` are forwarded to ``SynchronizedOStream.log``.
+        ``args`` and ``kwargs`` are forwarded to ``SynchronizedOStream.log``. The message is written asynchronously by the output stream writer thread.
         """
         self.__ostream.log(*args, **kwargs)
 
@@ -174,41 +376,191 @@ class Shell(cmd.Cmd):
         stop_event.set()
         await update_banner_task
 
-    async def __to_thread(self, callback: Callable[[], None]):
+    async def __read_commands(self) -> None:
+        """
+        Read and run the commands typed in the terminal without a dedicated thread
+
+        The standard input is watched by the loop, and every available character is given to the GNU Readline Library through its callback interface. The prompt is redrawn by the loop as well, since the library is not thread-safe. This method mimics ``cmdloop`` otherwise.
+        """
+        self.__reading_done = self.__loop.create_future()
+
+        self.preloop()
+        old_completer = readline.get_completer()
+        readline.set_completer(self.complete)
+        readline.parse_and_bind(self.completekey + ": complete")
+
+        try:
+            if self.intro:
+                self.stdout.write(str(self.intro) + "\n")
+
+            rle.callback_handler_install(self.prompt, self.__on_line)
+            self.__ostream.set_display_loop(self.__loop)
+            self.__resume_reading()
+            await self.__reading_done
+        finally:
+            self.__ostream.set_display_loop(None)
+            self.__stop_reading()
+            readline.set_completer(old_completer)
+            self.postloop()
+
+    def __on_line(self, line: Optional[str]) -> None:
+        """
+        Run a line read by the GNU Readline Library
+
+        ``line`` is ``None`` when an end-of-file is received.
+        """
+        if line is None:
+            line = "EOF"
+        elif line:
+            readline.add_history(line)
+
+        if self.__run_line(line):
+            self.__stop_reading()
+
+    def __pause_reading(self) -> None:
+        """
+        Stop watching the standard input until ``__resume_reading`` is called
+        """
+        if self.__is_reading:
+            self.__loop.remove_reader(self.__istream.fileno())
+            self.__is_reading = False
+
+    def __resume_reading(self) -> None:
+        """
+        Run the queued commands then watch the standard input again
+
+        It has no effect once the shell has stopped reading. Neither the queued commands nor the standard input are handled while a blocking task is running.
+        """
+        reading_done = self.__reading_done
+        if reading_done is None:
+            return
+
+        while (
+            self.cmdqueue and not self.__blocking_tasks_nb and not reading_done.done()
+        ):
+            if self.__run_line(self.cmdqueue.pop(0)):
+                self.__stop_reading()
+
+        if reading_done.done() or self.__blocking_tasks_nb or self.__is_reading:
+            return
+
+        self.__loop.add_reader(self.__istream.fileno(), rle.callback_read_char)
+        self.__is_reading = True
+
+    def __stop_reading(self) -> None:
         """
-        Reimplement the behavior of ``asyncio.to_thread`` (which is not available for <3.9)
+        Stop watching the standard input and notify ``__read_commands``
         """
+        if self.__reading_done is None or self.__reading_done.done():
+            return
+
+        self.__pause_reading()
+        rle.callback_handler_remove()
+        self.__reading_done.set_result(None)
 
-        thread = threading.Thread(target=callback)
-        thread.start()
+    def __run_line(self, line: str) -> bool:
+        """
+        Run a line through the same hooks as ``cmdloop`` and tell whether the shell should stop reading
 
-        while thread.is_alive():
-            await aio.sleep(0)
+        ``precmd`` and ``postcmd`` are skipped if they are not overridden, as the base class implementations do nothing. Exceptions raised while running the line are handled in the same way as those raised by a task, whether the line is read by ``cmdloop`` or by the loop.
+        """
+        try:
+            if self.__has_precmd:
+                line = self.precmd(line)
+            stop = self.onecmd(line)
+            if self.__has_postcmd:
+                stop = self.postcmd(stop, line)
+        except Exception as e:
+            self.__handle_error(e)
+            return False
 
-        thread.join()
+        return bool(stop)
+
+    def __is_in_loop_thread(self) -> bool:
+        """
+        Tell whether the caller runs in the same thread as the loop
+        """
+        return threading.get_ident() == self.__loop_thread_id
+
+    def __call_soon_threadsafe(self, callback: Callable[[], None]) -> None:
+        """
+        Schedule a callback to be called by the loop from any thread
+
+        Callbacks scheduled while the loop has not woken up yet are queued and called all at once, so a burst of commands only wakes the loop up once.
+        """
+        with self.__pending_callbacks_lock:
+            wake_up_loop = not self.__pending_callbacks
+            self.__pending_callbacks.append(callback)
+
+        if wake_up_loop:
+            self.__loop.call_soon_threadsafe(self.__call_pending_callbacks)
+
+    def __call_pending_callbacks(self) -> None:
+        """
+        Call every callback queued by ``__call_soon_threadsafe``
+
+        This method is not thread-safe and should only be called by the loop. A callback raising an exception does not prevent the next ones from being called.
+        """
+        with self.__pending_callbacks_lock:
+            callbacks = list(self.__pending_callbacks)
+            self.__pending_callbacks.clear()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                self.__handle_error(e)
 
     def __create_task(
         self,
         coro: Coroutine,
         cleanup_callback: Callable[[], None],
-        event: threading.Event,
+        event: Optional[threading.Event],
     ):
         """
         Schedule a coroutine to be carried out
 
         This method is not thread-safe and should only be called through ``create_task``.
-        """
 
-        async def impl(coro, event):
-            event.set()
-            await coro
+        The first step of the task is scheduled by the loop as soon as the task is created, so ``event`` (if any) is set by a callback scheduled right after it instead of wrapping the coroutine into another one. If the task cannot be created, ``event`` is set right away.
+        """
+        loop = self.__loop
 
-        task = self.__loop.create_task(impl(coro, event))
+        try:
+            task = loop.create_task(coro)
+        except BaseException:
+            if event is not None:
+                event.set()
+            raise
         task.add_done_callback(
             partial(self.__finalize_task, cleanup_callback=cleanup_callback)
         )
+        if event is not None:
+            loop.call_soon(event.set)
         self.__running_tasks.append(task)
 
+    def __call(
+        self,
+        f: Callable[[], None],
+        cleanup_callback: Callable[[], None],
+        event: Optional[threading.Event],
+    ):
+        """
+        Call a synchronous function then the cleaning callback
+
+        This method is not thread-safe and should only be called through ``call_soon``.
+        """
+        try:
+            try:
+                f()
+            finally:
+                cleanup_callback()
+        except Exception as e:
+            self.__handle_error(e)
+        finally:
+            if event is not None:
+                event.set()
+
     def __finalize_task(
         self, task: aio.Task, cleanup_callback: Callable[[], None] = lambda: None
     ):
@@ -227,14 +579,37 @@ class Shell(cmd.Cmd):
             e = task.exception()
             if e is not None:
                 raise e
-        except ShellError as e:
-            self.log_error(str(e))
         except Exception as e:
+            self.__handle_error(e)
+
+    def __handle_error(self, e: Exception):
+        """
+        Report an exception raised by a command
+
+        The shell keeps running if ``e`` is a ``ShellError``, otherwise it is stopped.
+        """
+        if isinstance(e, ShellError):
+            self.log_error(str(e))
+        else:
             self.__continue = False
             self.log_error(f"An unrecoverable error has occured : {e}")
             self.log_status("Press ENTER to quit.")
 
 
+def _index_names(cls: Type[Shell]) -> None:
+    """
+    Store the names of the ``do_``, ``help_`` and ``complete_`` methods of a shell class into frozensets
+    """
+    names = dir(cls)
+    cls._do_names = frozenset(name for name in names if name.startswith("do_"))
+    cls._help_names = frozenset(name for name in names if name.startswith("help_"))
+    cls._complete_names = frozenset(
+        name for name in names if name.startswith("complete_")
+    )
+
+
+_index_names(Shell)
+
 ShellType = TypeVar("ShellType", bound=Shell)
 
 
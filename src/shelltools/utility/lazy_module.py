@@ -0,0 +1,26 @@
+import importlib
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule(ModuleType):
+    """
+    Stand for a module which is only imported when one of its attributes is accessed
+
+    Once imported, the attributes of the module are copied into this object so later accesses do not go through ``__getattr__`` anymore.
+    """
+
+    def __init__(self, name: str, package: Optional[str] = None):
+        """
+        Store the arguments to be forwarded to ``importlib.import_module``
+        """
+        super().__init__(name)
+        self.__package = package
+
+    def __getattr__(self, attr: str) -> Any:
+        """
+        Import the module and get the requested attribute from it
+        """
+        module = importlib.import_module(self.__name__, self.__package)
+        self.__dict__.update(vars(module))
+        return getattr(module, attr)
@@ -1,14 +1,79 @@
 // cppimport
 
+#include <cstdlib>
+#include <utility>
+
 #include <pybind11/pybind11.h>
 #include <readline/readline.h>
 
+namespace {
+
+// Heap-allocated so it is never destroyed after the interpreter has been finalized
+pybind11::object *line_handler = nullptr;
+bool has_line_handler_failed = false;
+
+void call_line_handler(char *line) {
+  // The handler may remove itself, so a reference is kept for the duration of the call
+  pybind11::object handler = *line_handler;
+
+  try {
+    if (line == nullptr) {
+      handler(pybind11::none{});
+    } else {
+      handler(pybind11::str{line});
+    }
+  } catch (pybind11::error_already_set &e) {
+    // Exceptions must not be propagated through the GNU Readline Library
+    e.restore();
+    has_line_handler_failed = true;
+  }
+
+  std::free(line);
+}
+
+void callback_handler_install(const char *prompt, pybind11::object handler) {
+  delete line_handler;
+  line_handler = new pybind11::object{std::move(handler)};
+  rl_callback_handler_install(prompt, call_line_handler);
+}
+
+void callback_read_char() {
+  rl_callback_read_char();
+
+  if (has_line_handler_failed) {
+    has_line_handler_failed = false;
+    throw pybind11::error_already_set{};
+  }
+}
+
+void callback_handler_remove() {
+  rl_callback_handler_remove();
+  delete line_handler;
+  line_handler = nullptr;
+}
+
+} // namespace
+
 PYBIND11_MODULE(readline_extension, pymodule) {
   pymodule
     .def(
         "forced_update_display",
         rl_forced_update_display,
-        pybind11::doc{"Call `rl_forced_update_display` from the GNU Readline Library"});
+        pybind11::doc{"Call `rl_forced_update_display` from the GNU Readline Library"})
+    .def(
+        "callback_handler_install",
+        callback_handler_install,
+        pybind11::doc{"Call `rl_callback_handler_install` from the GNU Readline Library\n\n"
+                      "`handler` is called with each line read, or `None` on end-of-file."})
+    .def(
+        "callback_read_char",
+        callback_read_char,
+        pybind11::doc{"Call `rl_callback_read_char` from the GNU Readline Library\n\n"
+                      "Exceptions raised by the line handler are propagated to the caller."})
+    .def(
+        "callback_handler_remove",
+        callback_handler_remove,
+        pybind11::doc{"Call `rl_callback_handler_remove` from the GNU Readline Library"});
 }
 
 <%
@@ -1,13 +1,16 @@
 import asyncio as aio
 import io
-import os
-from itertools import chain
-from threading import Lock
-from typing import Callable, Iterable, List, NoReturn, Optional, TextIO
+from queue import Empty, SimpleQueue
+from threading import Event, Lock, Thread, current_thread, local
+from typing import Callable, Iterable, List, NoReturn, Optional, TextIO, Tuple, Union
 
-from . import readline_extension as rle  # type: ignore
+from .lazy_module import LazyModule
+from .terminal import get_columns, line_eraser
+
+rle = LazyModule(".readline_extension", __package__)
 
 UP_GOER = "\033[F"
+WRITER_IDLE_TIMEOUT_S = 100e-3
 
 
 class SynchronizedOStream(TextIO):
@@ -18,24 +21,36 @@ class SynchronizedOStream(TextIO):
         self.__lock = Lock()
         self.__use_rawinput = use_rawinput
         self.__modifier = modifier
-        self.__in_context = False
+        self.__thread_state = local()
         self.__banners: List[str] = []
+        self.__queue: SimpleQueue[Union[Tuple[str, bool], Event, None]] = SimpleQueue()
+        self.__writer: Optional[Thread] = None
+        self.__writer_lock = Lock()
+        self.__writer_error: Optional[Exception] = None
+        self.__display_loop: Optional[aio.AbstractEventLoop] = None
+        self.__is_display_update_pending = False
+
+        # The readline extension is built and imported by the calling thread rather than by the writer thread, so a failure is raised to the caller as soon as the stream is created
+        self.__forced_update_display: Callable[[], None] = (
+            rle.forced_update_display if use_rawinput else lambda: None
+        )
 
     def __enter__(self) -> "SynchronizedOStream":
         """
         Acquire the stream
 
-        Call to methods other than ``__exit__`` will not have any effect on the lock after entering the context (for example, ``write`` will not try to release the stream).
+        Call to methods other than ``__exit__`` will not have any effect on the lock after entering the context (for example, ``write`` will not try to release the stream). Everything written within the context is output in one go when leaving it.
         """
         self.__lock.acquire()
-        self.__in_context = True
+        self.__thread_state.context_buffer = []
         return self
 
     def __exit__(self, *_) -> None:
         """
         Release the stream
         """
-        self.__in_context = False
+        self.__put(("".join(self.__thread_state.context_buffer), False))
+        self.__thread_state.context_buffer = None
         self.__lock.release()
 
     def __iter__(*_) -> NoReturn:
@@ -45,6 +60,7 @@ class SynchronizedOStream(TextIO):
         raise NotImplementedError()
 
     def close(self) -> None:
+        self.stop()
         return self.__ostream.close()
 
     def isatty(self) -> bool:
@@ -84,33 +100,69 @@ class SynchronizedOStream(TextIO):
         """
         Write several lines consecutively
         """
-        self.__ostream.write(str(chain(lines)))
+        for line in lines:
+            self.write(line)
 
     def write(self, msg: str) -> int:
         """
         Write a string to the wrapped output stream
 
-        If this stream has not been locked yet with the context manager, the lock is released if and only if ``msg`` is newline-terminated or is empty.
+        If this stream has not been locked yet with the context manager, the string is held back until the calling thread writes a newline or calls ``flush``, so lines from different threads do not get mixed up.
+
+        The output is asynchronous: the string is handed over to a writer thread and may not have reached the wrapped stream yet when this method returns. ``flush`` waits for it.
         """
 
         if msg == "":
             return 0
 
-        if not self.__in_context:
-            self.__lock.acquire()
-        n = self.__ostream.write(
-            self.__modifier(msg) if self.__in_context and self.__use_rawinput else msg
-        )
-        if msg[-1] == "\n" and not self.__in_context:
-            self.__lock.release()
+        context_buffer = getattr(self.__thread_state, "context_buffer", None)
+        if context_buffer is not None:
+            context_buffer.append(self.__modifier(msg) if self.__use_rawinput else msg)
+            return len(msg)
 
-        return n
+        partial_line = getattr(self.__thread_state, "partial_line", [])
+        partial_line.append(msg)
+        if msg[-1] == "\n":
+            self.__put(("".join(partial_line), False))
+            partial_line = []
+        self.__thread_state.partial_line = partial_line
+
+        return len(msg)
 
     def flush(self) -> None:
         """
-        Call the underlying stream ``flush`` method
+        Wait for every queued string to be written then call the underlying stream ``flush`` method
+
+        The line the calling thread has started to write is queued first. If the writer thread failed to write something, the exception is raised here.
+        """
+        partial_line = getattr(self.__thread_state, "partial_line", None)
+        if partial_line:
+            self.__put(("".join(partial_line), False))
+            self.__thread_state.partial_line = []
+
+        if self.__writer is None and self.__queue.empty():
+            self.__ostream.flush()
+        else:
+            written_event = Event()
+            self.__put(written_event)
+            written_event.wait()
+
+        self.__raise_writer_error()
+
+    def stop(self) -> None:
+        """
+        Write everything that has been queued then stop the writer thread
+
+        The writer thread is started again if something is written afterwards. As with ``flush``, an exception raised by the writer thread is raised here.
         """
-        return self.__ostream.flush()
+        self.flush()
+
+        writer = self.__writer
+        if writer is not None:
+            self.__queue.put(None)
+            writer.join()
+
+        self.__raise_writer_error()
 
     def log(
         self,
@@ -121,24 +173,22 @@ class SynchronizedOStream(TextIO):
         """
         Print the given message to the output stream
 
-        A new line is inserted after the message.
+        A new line is inserted after the message. As with ``write``, the output is asynchronous.
         """
 
-        with self:
-            if modifier and self.__use_rawinput:
-                msg = modifier(msg)
+        if modifier and self.__use_rawinput:
+            msg = modifier(msg)
 
-            if self.__use_rawinput:
-                msg = _linewiper(msg)
-                for i, banner in enumerate(self.__banners):
-                    msg += _below(str(banner), position=i) + _linewiper()
-            else:
-                msg += "\n"
+        if self.__use_rawinput:
+            chunks = [_linewiper(msg)]
+            for i, banner in enumerate(self.__banners):
+                prefix, suffix = _banner_affixes(i)
+                chunks += (prefix, str(banner), suffix)
+            msg = "".join(chunks)
+        else:
+            msg += "\n"
 
-            self.__ostream.write(msg)
-
-            if self.__use_rawinput and regenerate_prompt:
-                rle.forced_update_display()
+        self.__put((msg, self.__use_rawinput and regenerate_prompt))
 
     async def update_banner(
         self, banner: str, refresh_delay_s: int, stop_event: aio.Event
@@ -146,31 +196,68 @@ class SynchronizedOStream(TextIO):
         """
         Add a banner to display, update its output regulary and remove it
 
-        The banner update can be stopped by setting ``stop_event``.
+        The banner update can be stopped by setting ``stop_event``. If rendering the banner raises an exception, the banner is removed and the exception is raised again by this coroutine. Each refresh is carried out by a loop callback which reschedules itself, rather than by a coroutine sleeping between refreshes.
+
+        If the banner has a ``version`` attribute, it is only rendered again when its version, its position or the terminal width changes. The last rendering is still written at every refresh so the banner is restored if something wrote over it.
         """
         self.__banners.append(banner)
 
         if not self.__use_rawinput:
             return
 
-        with self:
-            self.__ostream.write(_below(str(banner)))
-            rle.forced_update_display()
-
-        while not stop_event.is_set():
-            with self:
-                self.__ostream.write(
-                    _below(str(banner), position=self.__banners.index(banner))
-                    + _linewiper()
-                )
-                rle.forced_update_display()
-            await aio.sleep(refresh_delay_s)
-
-        with self:
-            self.__ostream.write(_below(position=self.__banners.index(banner)))
-            rle.forced_update_display()
+        loop = aio.get_running_loop()
+        frame = ""
+        frame_key: Optional[Tuple[Optional[int], int, int]] = None
+        prefix = suffix = ""
+        refresh_handle: Optional[aio.TimerHandle] = None
+        refresh_error: Optional[Exception] = None
+
+        def refresh(deadline: float) -> None:
+            nonlocal frame, frame_key, prefix, suffix, refresh_handle, refresh_error
+
+            try:
+                position = self.__banners.index(banner)
+                key = (getattr(banner, "version", None), position, get_columns())
+                if frame_key is None or key[1:] != frame_key[1:]:
+                    prefix, suffix = _banner_affixes(position)
+                if key[0] is None or key != frame_key:
+                    frame = "".join((prefix, str(banner), suffix))
+                    frame_key = key
+            except Exception as e:
+                # The error is raised again by the coroutine, which is woken up by the stop event
+                refresh_error = e
+                stop_event.set()
+                return
+
+            self.__put((frame, True))
+
+            # The next refresh is planned from the previous deadline so the delays do not drift, unless the loop is running late
+            deadline = max(deadline + refresh_delay_s, loop.time())
+            refresh_handle = loop.call_at(deadline, refresh, deadline)
+
+        try:
+            self.__put((_below(str(banner)), True))
+            refresh(loop.time())
+            try:
+                await stop_event.wait()
+            finally:
+                if refresh_handle is not None:
+                    refresh_handle.cancel()
+
+            self.__put((_below(position=self.__banners.index(banner)), True))
+        finally:
+            self.__banners.remove(banner)
+
+        if refresh_error is not None:
+            raise refresh_error
+
+    def set_display_loop(self, loop: Optional[aio.AbstractEventLoop]) -> None:
+        """
+        Set the loop which runs the GNU Readline Library
 
-        self.__banners.remove(banner)
+        The prompt is then redrawn by this loop after something is written, rather than by the writer thread, as the library is not thread-safe. With ``None``, the writer thread redraws the prompt itself.
+        """
+        self.__display_loop = loop
 
     def acquire(self) -> None:
         """
@@ -184,6 +271,146 @@ class SynchronizedOStream(TextIO):
         """
         self.__lock.release()
 
+    def __put(self, item: Union[Tuple[str, bool], Event]) -> None:
+        """
+        Queue a string or a flush notification for the writer thread, starting it if needed
+        """
+        self.__queue.put(item)
+
+        if self.__writer is None:
+            self.__start_writer()
+
+    def __start_writer(self) -> None:
+        """
+        Start the writer thread if it is not running
+        """
+        with self.__writer_lock:
+            if self.__writer is None:
+                # Not a daemon, so queued output is not lost when the program exits
+                self.__writer = Thread(target=self.__write_queued)
+                self.__writer.start()
+
+    def __write_queued(self) -> None:
+        """
+        Write the queued strings to the wrapped output stream
+
+        This method is run by the writer thread. Strings queued while the previous ones were being written are output with a single write and a single display update. The thread stops once it has been idle for ``WRITER_IDLE_TIMEOUT_S`` seconds or when ``stop`` is called.
+
+        Exceptions raised while writing are stored to be raised by the next call to ``flush`` or ``stop``, and the thread goes on writing.
+        """
+        try:
+            self.__write_batches()
+        finally:
+            # If the thread is stopped by an unexpected error, another one takes over what is left in the queue
+            with self.__writer_lock:
+                if self.__writer is current_thread():
+                    self.__writer = None
+            if not self.__queue.empty():
+                self.__start_writer()
+
+    def __write_batches(self) -> None:
+        """
+        Write the queued strings batch by batch until the writer thread should stop
+        """
+        while True:
+            try:
+                items = [self.__queue.get(timeout=WRITER_IDLE_TIMEOUT_S)]
+            except Empty:
+                items = []
+            try:
+                while True:
+                    items.append(self.__queue.get_nowait())
+            except Empty:
+                pass
+
+            chunks = []
+            update_display = False
+            written_events = []
+            must_stop = not items
+            for item in items:
+                if item is None:
+                    must_stop = True
+                elif isinstance(item, Event):
+                    written_events.append(item)
+                else:
+                    chunks.append(item[0])
+                    update_display = update_display or item[1]
+
+            try:
+                if chunks:
+                    self.__ostream.write("".join(chunks))
+                if update_display:
+                    self.__request_display_update()
+                if written_events:
+                    self.__ostream.flush()
+            except (OSError, ValueError):
+                # The wrapped stream is closed, so there is nowhere to write to
+                pass
+            except Exception as e:
+                self.__writer_error = e
+            finally:
+                for event in written_events:
+                    event.set()
+
+            if must_stop and not self.__keep_writing():
+                return
+
+    def __raise_writer_error(self) -> None:
+        """
+        Raise the last exception stored by the writer thread, if any
+        """
+        error, self.__writer_error = self.__writer_error, None
+        if error is not None:
+            raise error
+
+    def __request_display_update(self) -> None:
+        """
+        Redraw the prompt, or ask the display loop to do so if there is one
+
+        Requests made while the display loop has not redrawn the prompt yet are merged into one.
+        """
+        loop = self.__display_loop
+        if loop is None:
+            self.__forced_update_display()
+            return
+
+        if self.__is_display_update_pending:
+            return
+
+        self.__is_display_update_pending = True
+        try:
+            loop.call_soon_threadsafe(self.__update_display)
+        except RuntimeError:
+            # The loop is closed, so there is no prompt to redraw
+            self.__is_display_update_pending = False
+
+    def __update_display(self) -> None:
+        """
+        Redraw the prompt from the display loop
+        """
+        self.__is_display_update_pending = False
+        if self.__display_loop is not None:
+            self.__forced_update_display()
+
+    def __keep_writing(self) -> bool:
+        """
+        Retire the writer thread, unless something has been queued in the meantime
+
+        This method is called by the writer thread before it stops. It tells whether the thread should go on writing.
+        """
+        with self.__writer_lock:
+            self.__writer = None
+
+        if self.__queue.empty():
+            return False
+
+        with self.__writer_lock:
+            if self.__writer is not None:
+                return False
+            self.__writer = current_thread()
+
+        return True
+
 
 def _linewiper(msg: Optional[str] = None) -> str:
     """
@@ -191,12 +418,7 @@ def _linewiper(msg: Optional[str] = None) -> str:
 
     With no argument, the line is just wiped and no newlines are inserted.
     """
-    return (
-        "\r"
-        + " " * os.get_terminal_size().columns
-        + "\r"
-        + (msg + "\n" if msg is not None else "")
-    )
+    return line_eraser() + (msg + "\n" if msg is not None else "")
 
 
 def _below(msg: str = "", position: int = 0) -> str:
@@ -205,10 +427,16 @@ def _below(msg: str = "", position: int = 0) -> str:
 
     A message can be printed several lines below with the ``position`` parameter.
     """
+    return "\n" * (position + 1) + line_eraser() + msg + UP_GOER * (position + 1)
+
+
+def _banner_affixes(position: int) -> Tuple[str, str]:
+    """
+    Return the strings to write before and after a banner to print it below the cursor
+
+    Unlike ``_below``, the line of the cursor is also wiped after going back up. The affixes only depend on the position and the terminal width, so they can be reused for as long as those do not change.
+    """
     return (
-        "\n" * (position + 1)
-        + " " * os.get_terminal_size().columns
-        + "\r"
-        + msg
-        + UP_GOER * (position + 1)
+        "\n" * (position + 1) + line_eraser(),
+        UP_GOER * (position + 1) + line_eraser(),
     )
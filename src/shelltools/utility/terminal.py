@@ -0,0 +1,115 @@
+import asyncio as aio
+import os
+import signal
+from typing import Any, Optional
+
+DEFAULT_COLUMNS = 80
+
+_columns: Optional[int] = None
+_line_eraser: Optional[str] = None
+_is_resize_tracked = False
+_loop: Optional[aio.AbstractEventLoop] = None
+_previous_sigwinch_handler: Any = None
+
+
+def get_columns() -> int:
+    """
+    Get the width of the terminal
+
+    The width is cached until the terminal is resized. If it cannot be retrieved, ``DEFAULT_COLUMNS`` is returned.
+    """
+    global _columns
+
+    if _columns is not None:
+        return _columns
+
+    try:
+        columns = os.get_terminal_size().columns
+    except OSError:
+        columns = DEFAULT_COLUMNS
+
+    if _is_resize_tracked:
+        _columns = columns
+
+    return columns
+
+
+def line_eraser() -> str:
+    """
+    Get a string that erases the current line and brings the cursor back at its beginning
+
+    The string is cached until the terminal is resized.
+    """
+    global _line_eraser
+
+    if _line_eraser is not None:
+        return _line_eraser
+
+    eraser = "\r" + " " * get_columns() + "\r"
+
+    if _is_resize_tracked:
+        _line_eraser = eraser
+
+    return eraser
+
+
+def start_tracking_resize(loop: aio.AbstractEventLoop) -> bool:
+    """
+    Cache the terminal width until the terminal is resized
+
+    A SIGWINCH handler is added to ``loop``, which must be run by the main thread, and the previous handler keeps being called on resize. Return ``True`` if the resize is now tracked. It cannot be on Windows or from another thread, in which case nothing is cached.
+    """
+    global _loop, _previous_sigwinch_handler, _is_resize_tracked
+
+    if _is_resize_tracked or not hasattr(signal, "SIGWINCH"):
+        return False
+
+    previous_handler = signal.getsignal(signal.SIGWINCH)
+    try:
+        loop.add_signal_handler(signal.SIGWINCH, _on_resize)
+    except (NotImplementedError, RuntimeError, ValueError):
+        return False
+
+    _loop = loop
+    _previous_sigwinch_handler = previous_handler
+    _is_resize_tracked = True
+    return True
+
+
+def stop_tracking_resize() -> None:
+    """
+    Remove the SIGWINCH handler added by ``start_tracking_resize`` and stop caching the terminal width
+    """
+    global _loop, _previous_sigwinch_handler, _is_resize_tracked
+
+    if not _is_resize_tracked or _loop is None:
+        return
+
+    _loop.remove_signal_handler(signal.SIGWINCH)
+    if _previous_sigwinch_handler is not None:
+        signal.signal(signal.SIGWINCH, _previous_sigwinch_handler)
+
+    _loop = None
+    _previous_sigwinch_handler = None
+    _is_resize_tracked = False
+    _invalidate()
+
+
+def _on_resize() -> None:
+    """
+    Invalidate the cached values then forward the signal to the previous handler
+    """
+    _invalidate()
+
+    if callable(_previous_sigwinch_handler):
+        _previous_sigwinch_handler(signal.SIGWINCH, None)
+
+
+def _invalidate() -> None:
+    """
+    Clear the cached values
+    """
+    global _columns, _line_eraser
+
+    _columns = None
+    _line_eraser = None
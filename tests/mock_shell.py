@@ -9,6 +9,22 @@ from shelltools.shell.command import argument, command
 from shelltools.utility.match import Match
 
 
+class CountingInt:
+    """
+    Convert strings to integers and count the conversions
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, s):
+        self.calls += 1
+        return int(s)
+
+
+counting_int = CountingInt()
+
+
 class MockShell(Shell):
     def __init__(self, *args, **kwargs):
         self.x = 0
@@ -30,6 +46,14 @@ class MockShell(Shell):
         """
         self.x += n
 
+    @command()
+    @argument("n", type=counting_int)
+    def do_counted_increment_by(self, n):
+        """
+        Increment n times, counting the conversions of n
+        """
+        self.x += n
+
     @command()
     def do_alert(self):
         """
@@ -1,9 +1,18 @@
+import asyncio as aio
+import os
 import random as rnd
+import re
+import subprocess
+import sys
+from importlib import import_module
 from io import StringIO
+from types import SimpleNamespace
 
 import pytest
 
-from .mock_shell import MockShell
+from shelltools.shell.command import argument, command
+
+from .mock_shell import MockShell, counting_int
 
 
 @pytest.fixture
@@ -72,3 +81,292 @@ async def test_cancel_tasks_on_exit(mock_shell, mock_stdin):
     await mock_shell.run()
 
     assert mock_shell.cancelled == True
+
+
+@pytest.mark.asyncio
+async def test_run_repeated_command_with_argument(mock_shell, mock_stdin):
+    mock_stdin.write("increment_by 5\nincrement_by 5\nincrement_by 2\nEOF\n")
+    mock_stdin.seek(0)
+    n = rnd.randint(0, 100)
+    mock_shell.x = n
+    await mock_shell.run()
+
+    assert mock_shell.x == n + 12
+
+
+@pytest.mark.asyncio
+async def test_run_command_with_invalid_argument(mock_shell, mock_stdin):
+    mock_stdin.write("increment_by five\nincrement_by 5 5\nEOF\n")
+    mock_stdin.seek(0)
+    n = rnd.randint(0, 100)
+    mock_shell.x = n
+    await mock_shell.run()
+
+    assert mock_shell.x == n
+
+
+@pytest.mark.asyncio
+async def test_recover_from_shell_error(mock_shell, mock_stdin, mock_stdout):
+    mock_stdin.write("error\nincrement\nEOF\n")
+    mock_stdin.seek(0)
+    n = rnd.randint(0, 100)
+    mock_shell.x = n
+    await mock_shell.run()
+
+    assert mock_shell.x == n + 1
+    assert mock_stdout.getvalue().startswith("Oops\n")
+
+
+@pytest.mark.asyncio
+async def test_exit_on_unrecoverable_error(mock_shell, mock_stdin, mock_stdout):
+    mock_stdin.write("panic\nincrement\nEOF\n")
+    mock_stdin.seek(0)
+    n = rnd.randint(0, 100)
+    mock_shell.x = n
+    await mock_shell.run()
+
+    assert mock_shell.x == n
+    assert "An unrecoverable error has occured : I panicked\n" in mock_stdout.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_parse_repeated_argument_once(mock_shell, mock_stdin):
+    n = rnd.randint(10**6, 10**9)
+    mock_stdin.write(f"counted_increment_by {n}\n" * 3 + "EOF\n")
+    mock_stdin.seek(0)
+    mock_shell.x = 0
+    calls = counting_int.calls
+    await mock_shell.run()
+
+    assert mock_shell.x == 3 * n
+    assert counting_int.calls == calls + 1
+
+
+@pytest.mark.asyncio
+async def test_parse_simple_argument_without_argparse(
+    mock_shell, mock_stdin, monkeypatch
+):
+    argument_parser_class = import_module("shelltools.shell.command")._ArgumentParser
+    parse = argument_parser_class.parse
+    calls = []
+
+    def counting_parse(self, *args, **kwargs):
+        calls.append(args)
+        return parse(self, *args, **kwargs)
+
+    monkeypatch.setattr(argument_parser_class, "parse", counting_parse)
+
+    n = rnd.randint(10**6, 10**9)
+    mock_stdin.write(f"increment_by {n}\nincrement_by five\nEOF\n")
+    mock_stdin.seek(0)
+    mock_shell.x = 0
+    await mock_shell.run()
+
+    assert mock_shell.x == n
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize(
+    "spec", [{"type": "int"}, {"type": int, "metavar": ("N", "M")}]
+)
+def test_reject_invalid_argument_on_definition(spec):
+    with pytest.raises(ValueError):
+
+        class InvalidShell(MockShell):
+            @command()
+            @argument("n", **spec)
+            def do_add(self, n):
+                """
+                Add n
+                """
+                self.x += n
+
+
+class CountingBanner:
+    def __init__(self, version=None):
+        self.renders = 0
+        if version is not None:
+            self.version = version
+
+    def __str__(self):
+        self.renders += 1
+        return "banner"
+
+
+@pytest.mark.asyncio
+async def test_render_unchanged_banner_once(mock_stdout, monkeypatch):
+    synchronized_ostream = import_module("shelltools.utility.synchronized_ostream")
+    monkeypatch.setattr(
+        synchronized_ostream,
+        "rle",
+        SimpleNamespace(forced_update_display=lambda: None),
+    )
+    ostream = synchronized_ostream.SynchronizedOStream(
+        mock_stdout, use_rawinput=True, modifier=lambda x: x
+    )
+    versioned_banner = CountingBanner(version=1)
+    unversioned_banner = CountingBanner()
+
+    for banner in (versioned_banner, unversioned_banner):
+        stop_event = aio.Event()
+        update_banner_task = aio.create_task(
+            ostream.update_banner(banner, refresh_delay_s=1e-3, stop_event=stop_event)
+        )
+        await aio.sleep(50e-3)
+        stop_event.set()
+        await update_banner_task
+    ostream.stop()
+
+    # The banner is rendered once when added and once by the first refresh
+    assert versioned_banner.renders == 2
+    assert unversioned_banner.renders > 2
+
+
+class FailingOnceStringIO(StringIO):
+    def __init__(self):
+        super().__init__()
+        self.has_failed = False
+
+    def write(self, s):
+        if not self.has_failed:
+            self.has_failed = True
+            raise RuntimeError("write failed")
+        return super().write(s)
+
+
+@pytest.mark.timeout(5)
+def test_report_write_error_and_keep_writing():
+    synchronized_ostream = import_module("shelltools.utility.synchronized_ostream")
+    stream = FailingOnceStringIO()
+    ostream = synchronized_ostream.SynchronizedOStream(
+        stream, use_rawinput=False, modifier=lambda x: x
+    )
+
+    ostream.log("lost")
+    with pytest.raises(RuntimeError, match="write failed"):
+        ostream.flush()
+
+    ostream.log("hello")
+    ostream.stop()
+
+    assert stream.getvalue() == "hello\n"
+
+
+LAZY_IMPORT_SCRIPT = """
+import asyncio as aio
+import sys
+from io import StringIO
+
+from shelltools.shell import Shell
+
+shell = Shell(istream=StringIO("EOF\\n"), ostream=StringIO())
+aio.run(shell.run())
+for name in ("terminology", "shelltools.utility.readline_extension"):
+    if name in sys.modules:
+        print(name)
+"""
+
+
+def test_do_not_import_terminal_modules_without_terminal():
+    loaded_modules = subprocess.run(
+        [sys.executable, "-c", LAZY_IMPORT_SCRIPT],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+
+    assert loaded_modules == ""
+
+
+PTY_SHELL_SCRIPT = """
+import asyncio as aio
+from importlib import import_module
+
+from shelltools.shell.command import command
+from tests.mock_shell import MockShell
+
+
+class FakeListener:
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+import_module("shelltools.shell.command").KeyboardListener = FakeListener
+
+
+class PtyShell(MockShell):
+    increments_during_capture = 0
+
+    @command(capture_keyboard="listener")
+    async def do_capture(self, listener):
+        x = self.x
+        await aio.sleep(0.5)
+        self.increments_during_capture += self.x - x
+
+
+shell = PtyShell(prompt="PROMPT-")
+shell.cmdqueue.append("capture")
+aio.run(shell.run())
+print("RESULT", shell.x, shell.increments_during_capture)
+"""
+
+
+@pytest.mark.timeout(60)
+def test_compile_readline_extension():
+    from shelltools.utility import readline_extension as rle
+
+    for name in (
+        "forced_update_display",
+        "callback_handler_install",
+        "callback_read_char",
+        "callback_handler_remove",
+    ):
+        assert callable(getattr(rle, name))
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a pseudo-terminal")
+@pytest.mark.timeout(60)
+def test_read_commands_from_terminal():
+    import fcntl
+    import pty
+    import struct
+    import termios
+
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack("HHHH", 24, 80, 0, 0))
+    shell_process = subprocess.Popen(
+        [sys.executable, "-c", PTY_SHELL_SCRIPT],
+        stdin=slave,
+        stdout=slave,
+        stderr=slave,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env={**os.environ, "TERM": "xterm"},
+    )
+    os.close(slave)
+
+    output = b""
+
+    def read_output(until=None):
+        nonlocal output
+        while until is None or until not in output:
+            try:
+                chunk = os.read(master, 1024)
+            except OSError:
+                return
+            if not chunk:
+                return
+            output += chunk
+
+    # The queued command captures the keyboard, so the typed lines are only read once it is done
+    read_output(until=b"PROMPT-")
+    os.write(master, b"increment\rcapture\rincrement\r\x04")
+    read_output()
+    shell_process.wait()
+    os.close(master)
+
+    result = re.search(rb"RESULT (\d+) (\d+)", output)
+    assert result is not None, output
+    assert result.groups() == (b"2", b"0")